@@ -1,11 +1,15 @@
 import asyncio
+import logging
+import os
 import shutil
-import uuid
+import subprocess
 from pathlib import Path
+from urllib.parse import quote
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from starlette.background import BackgroundTask
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
 
 # --- Application Settings ---
 app = FastAPI(
@@ -13,37 +17,184 @@ app = FastAPI(
     description="An API to convert AAC to MP4 using a fixed 'logo.png' image.",
 )
 
-# Create a temporary directory to store uploaded and output files
-TEMP_DIR = Path("temp_files")
-TEMP_DIR.mkdir(exist_ok=True)
-
 # Define the path to the fixed logo image
 LOGO_PATH = Path("logo.png")
 
+# Pre-encoded video of the logo, generated at startup and stream-copied
+# into every output so requests never run the video encoder
+LOGO_VIDEO_PATH = Path("logo.mp4")
+
+# Chunk size used when streaming data to and from FFmpeg (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 
 # --- FFmpeg Check ---
-def check_ffmpeg_installed():
-    """Checks if FFmpeg is installed and accessible in the system PATH."""
-    if not shutil.which("ffmpeg"):
+def check_ffmpeg_installed() -> str:
+    """Returns the absolute path to FFmpeg, or raises if it is not installed.
+
+    Resolving the binary once at startup means each launch execs the
+    absolute path directly instead of re-scanning PATH.
+    """
+    ffmpeg_bin = shutil.which("ffmpeg")
+    if not ffmpeg_bin:
         raise RuntimeError(
             "FFmpeg not found. Please install FFmpeg and ensure it's in the system's PATH."
         )
+    return ffmpeg_bin
 
 
-# Run check on startup
-check_ffmpeg_installed()
+def prepare_logo_video():
+    """Pre-encodes 'logo.png' to a short H.264 clip, once per logo change.
+
+    Doing the x264 work a single time at startup lets every request reuse
+    the result with '-stream_loop -1 ... -c:v copy', so the per-request
+    pipeline is pure muxing with no video encoding at all.
+    """
+    if (
+        LOGO_VIDEO_PATH.exists()
+        and LOGO_VIDEO_PATH.stat().st_mtime >= LOGO_PATH.stat().st_mtime
+    ):
+        return
+    cmd = [
+        FFMPEG_BIN,
+        "-y",
+        "-loop",
+        "1",
+        "-r",
+        "1",
+        "-t",
+        "1",
+        "-i",
+        str(LOGO_PATH),
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-tune",
+        "stillimage",
+        "-x264-params",
+        "keyint=1",  # IDR-only so the clip can be looped seamlessly
+        "-pix_fmt",
+        "yuv420p",
+        str(LOGO_VIDEO_PATH),
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Failed to pre-encode logo video: {result.stderr.decode().strip()}"
+        )
+
+
+# Run check on startup and cache the resolved binary path
+FFMPEG_BIN = check_ffmpeg_installed()
 
 # Check if logo.png exists on startup
 if not LOGO_PATH.exists():
     raise RuntimeError("logo.png file not found in the working directory.")
 
+# Pre-encode the logo video once so request time is mux-only
+prepare_logo_video()
+
+
+# --- FFmpeg Worker Pool ---
+# The conversion command muxing the logo video with piped-in audio. Nothing
+# in it varies per request anymore (audio in via pipe:0, MP4 out via
+# pipe:1), so it is evaluated exactly once at import time.
+_CONVERT_CMD = (
+    FFMPEG_BIN,
+    "-nostats",  # No progress lines; they would pile up in our stderr buffer
+    "-loglevel",
+    "error",  # Only actual errors on stderr, keeping it tiny
+    "-threads",
+    "1",  # Jobs are mux-only; one thread each keeps scheduling predictable
+    "-stream_loop",
+    "-1",  # Loop the pre-encoded logo clip indefinitely
+    "-i",
+    str(LOGO_VIDEO_PATH),  # Input 1: The logo video pre-encoded at startup
+    "-i",
+    "pipe:0",  # Input 2: The uploaded AAC audio file, streamed via stdin
+    "-c:v",
+    "copy",  # Video was encoded at startup; just remux it
+    "-c:a",
+    "copy",  # Directly copy the audio stream, no re-encoding (very fast)
+    "-bsf:a",
+    # ADTS AAC needs this header rewrite to be muxed into MP4; ffmpeg
+    # auto-inserts it for file output but not for fragmented output to a pipe
+    "aac_adtstoasc",
+    "-shortest",  # Stop output when the shortest input stream (audio) ends
+    "-movflags",
+    "+frag_keyframe+empty_moov",  # Fragmented MP4: playable as it streams
+    "-f",
+    "mp4",  # No filename to infer the format from when writing to a pipe
+    "pipe:1",  # Stream the output straight to the HTTP response
+)
+
 
-# --- Cleanup Function ---
-def cleanup_files(paths: list[Path]):
-    """Deletes the specified temporary files."""
-    for path in paths:
-        if path and path.exists():
-            path.unlink()
+class FFmpegWorkerPool:
+    """Keeps warm, pre-spawned FFmpeg processes ready for incoming requests.
+
+    An FFmpeg process reading from pipe:0 blocks until data arrives, so we
+    can pay the fork+exec and FFmpeg self-init cost ahead of time: each
+    worker is spawned and parked until a request claims it. Claiming a
+    worker immediately schedules a replacement, so the spawn cost overlaps
+    with the running job instead of preceding it.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def start(self):
+        """Pre-spawns the initial set of workers."""
+        for _ in range(self._size):
+            await self._spawn_worker()
+
+    async def stop(self):
+        """Terminates any idle workers."""
+        while not self._idle.empty():
+            process = self._idle.get_nowait()
+            process.kill()
+            await process.wait()
+
+    async def _spawn_worker(self):
+        # close_fds=False lets CPython use posix_spawn instead of falling
+        # back to fork+exec, avoiding a page-table copy of this process per
+        # launch. Safe here: since PEP 446 Python-created fds are
+        # non-inheritable by default, so nothing sensitive leaks to FFmpeg.
+        process = await asyncio.create_subprocess_exec(
+            *_CONVERT_CMD,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            close_fds=False,
+        )
+        self._idle.put_nowait(process)
+
+    async def acquire(self):
+        """Returns a ready FFmpeg process and schedules a replacement."""
+        if self._idle.empty():
+            await self._spawn_worker()
+        process = self._idle.get_nowait()
+        asyncio.ensure_future(self._spawn_worker())
+        return process
+
+
+# Cap concurrent jobs so a burst queues instead of thrashing the CPU;
+# combined with -threads 1 per process, load on the cores stays predictable
+FFMPEG_MAX_CONCURRENCY = int(os.getenv("FFMPEG_MAX_CONCURRENCY", os.cpu_count() or 2))
+FFMPEG_SEM = asyncio.Semaphore(FFMPEG_MAX_CONCURRENCY)
+
+FFMPEG_POOL = FFmpegWorkerPool(FFMPEG_MAX_CONCURRENCY)
+
+
+@app.on_event("startup")
+async def warm_ffmpeg_pool():
+    await FFMPEG_POOL.start()
+
+
+@app.on_event("shutdown")
+async def drain_ffmpeg_pool():
+    await FFMPEG_POOL.stop()
 
 
 # --- API Endpoint ---
@@ -55,71 +206,105 @@ async def convert_aac_to_mp4_with_logo(
     Converts an AAC file to an MP4 video using a fixed 'logo.png' image.
     The 'logo.png' will be used as the visual track for the entire duration of the audio.
     """
-    job_id = str(uuid.uuid4())
-    files_to_clean = []
+    # The client filename is only ever used for the Content-Disposition
+    # header, never as a filesystem path. Encode it the way Starlette's
+    # FileResponse does (RFC 5987 filename* for non-ASCII names), and do it
+    # before claiming any worker so a bad name cannot leak resources.
+    stem = Path(audio_file.filename or "audio").stem or "audio"
+    download_name = f"converted_{stem}.mp4"
+    quoted_name = quote(download_name)
+    if quoted_name == download_name:
+        content_disposition = f'attachment; filename="{download_name}"'
+    else:
+        content_disposition = f"attachment; filename*=utf-8''{quoted_name}"
+
+    # --- Claim a Warm FFmpeg Worker ---
+    # The worker was spawned ahead of time and is blocked waiting for
+    # audio on its stdin; the upload is fed to it while still arriving,
+    # so muxing overlaps with the network receive. The semaphore is held
+    # until the response has finished streaming, so at most
+    # FFMPEG_MAX_CONCURRENCY jobs run at once and bursts queue up instead
+    # of fighting over the cores.
+    await FFMPEG_SEM.acquire()
+    process = None
+    pump_task = None
+    stderr_task = None
 
     try:
-        # --- Save Uploaded Audio File ---
-        input_aac_path = TEMP_DIR / f"{job_id}_{audio_file.filename}"
-        await _save_upload_file(audio_file, input_aac_path)
-        files_to_clean.append(input_aac_path)
-
-        output_mp4_path = TEMP_DIR / f"{job_id}_output.mp4"
-        files_to_clean.append(output_mp4_path)
-
-        # --- Construct FFmpeg Command ---
-        cmd = [
-            "ffmpeg",
-            "-y",  # Overwrite existing output file without asking
-            "-loop",
-            "1",  # Loop the image
-            "-i",
-            str(LOGO_PATH),  # Input 1: The fixed logo image
-            "-i",
-            str(input_aac_path),  # Input 2: The uploaded AAC audio file
-            "-c:v",
-            "libx264",  # Video encoder
-            "-pix_fmt",
-            "yuv420p",  # Ensure player compatibility (important for wide playback)
-            "-c:a",
-            "copy",  # Directly copy the audio stream, no re-encoding (very fast)
-            "-shortest",  # Stop output when the shortest input stream (audio) ends
-            str(output_mp4_path),
-        ]
-
-        # --- Execute FFmpeg ---
-        process = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        process = await FFMPEG_POOL.acquire()
+        pump_task = asyncio.ensure_future(_pump_upload_to_stdin(audio_file, process))
+        stderr_task = asyncio.ensure_future(process.stderr.read())
 
-        if process.returncode != 0:
+        # Read the first output chunk before committing to a response, so a
+        # malformed upload still produces a proper 500 with FFmpeg's error
+        # instead of an empty 200 body.
+        first_chunk = await process.stdout.read(UPLOAD_CHUNK_SIZE)
+        if not first_chunk:
+            await pump_task
+            stderr = await stderr_task
+            await process.wait()
             error_detail = stderr.decode().strip()
             raise HTTPException(
                 status_code=500, detail=f"FFmpeg conversion failed: {error_detail}"
             )
-
-        # --- Return File and Cleanup ---
-        return FileResponse(
-            path=output_mp4_path,
-            media_type="video/mp4",
-            filename=f"converted_{Path(audio_file.filename).stem}.mp4",
-            background=BackgroundTask(cleanup_files, files_to_clean),
-        )
-
     except Exception as e:
-        # Ensure cleanup happens even on unexpected errors
-        cleanup_files(files_to_clean)
+        # Don't leak a half-running worker or the semaphore permit on errors
+        if pump_task:
+            pump_task.cancel()
+        if stderr_task:
+            stderr_task.cancel()
+        if process and process.returncode is None:
+            process.kill()
+            await process.wait()
+        FFMPEG_SEM.release()
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def stream_output():
+        try:
+            yield first_chunk
+            while chunk := await process.stdout.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+            await process.wait()
+            if process.returncode != 0:
+                # The response status is already committed, so the client
+                # gets a truncated body; make sure the failure is at least
+                # visible server-side instead of vanishing silently.
+                stderr = await stderr_task
+                logger.error(
+                    "FFmpeg exited with code %s mid-stream; output truncated: %s",
+                    process.returncode,
+                    stderr.decode().strip(),
+                )
+        finally:
+            pump_task.cancel()
+            stderr_task.cancel()
+            # Only reachable with a live process if the client disconnected
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            FFMPEG_SEM.release()
+
+    return StreamingResponse(
+        stream_output(),
+        media_type="video/mp4",
+        headers={"Content-Disposition": content_disposition},
+    )
 
-async def _save_upload_file(upload_file: UploadFile, destination: Path):
-    """Helper function to save an UploadFile to a destination."""
-    contents = await upload_file.read()
-    with open(destination, "wb") as f:
-        f.write(contents)
+
+async def _pump_upload_to_stdin(upload_file: UploadFile, process):
+    """Feeds the uploaded file into FFmpeg's stdin in bounded chunks."""
+    try:
+        while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # FFmpeg exited before consuming the whole upload; its stderr
+        # (checked by the caller) will carry the actual error.
+        pass
+    finally:
+        process.stdin.close()
 
 
 @app.get("/", tags=["Root"])